@@ -18,19 +18,28 @@ Definitions:
 Usage:
     scheduler.py -h | --help
     scheduler.py --day <day>
-    scheduler.py --day <day> --byempl
+    scheduler.py --day <day> --byempl [--lengths]
     scheduler.py --day <day> --time <time>
     scheduler.py --day <day> --name <name>
     scheduler.py --count (--day <day>)
     scheduler.py --name <name>
+    scheduler.py --tightest <n> [--day <day>]
+    scheduler.py --validate <file>
+    scheduler.py --partners <k> [--day <day>] [--name <name>]
+    scheduler.py --bundle <dir>
 
 Options:
     --help, -h              Show this message
     --day, -d <day>         Get availabilities for day, by time
     --byempl, -e            Get availabilities by empl (requires --day)
+    --lengths, -l           List every possible shift length (with --byempl)
     --time, -t <time>       Get availabilities for a time (requires --day)
     --name, -n <name>       Get availabilities for employee 'name'
     --count, -c             Count hours each empl is available (--day optional)
+    --tightest, -w <n>      Rank the n tightest shift windows (--day optional)
+    --validate, -v <file>   Check a draft schedule file against prefs
+    --partners, -p <k>      List each empl's top k overlapping coworkers
+    --bundle, -b <dir>      Write every report for the week into dir
 
 Detailed explanation of options:
     Runing the script without any options will only display the help message.
@@ -41,6 +50,8 @@ Detailed explanation of options:
     correctly spelled day of the week (case insensitive). If one wishes to
     see the availability by employee on that day, this can be run with both
     --day and --byempl.
+    Adding the --lengths flag to that also lists every shift length each
+    employee could work, starting from each time.
 
     In conjunction with the --day option, one can use a --time option to see
     the availabilities at a certain time that day. The time should be in the
@@ -57,6 +68,30 @@ Detailed explanation of options:
     be used as well, to restrict counting to a particular day. By default,
     the hours are counted for every day.
 
+    To find the hardest times to staff, --tightest ranks every possible shift
+    window (any length, from the minimum shift length up, starting on the
+    half hour) by the fewest employees available in any one slot of it, and
+    prints the n tightest. Those counts may be different people in different
+    slots, so fewer may be able to cover the whole window. As with --count, --day restricts this to a single day; by
+    default, windows from the whole week are ranked together.
+
+    Once a draft schedule exists, --validate checks it against everyone's
+    prefs. The file has one shift per line, as comma-separated employee, day,
+    start and end (e.g., "Test Student,monday,1:30,4:00"). Shifts that overlap
+    times the employee cannot work or dislikes working, shifts shorter than
+    the minimum shift length, shifts outside of 8:00 - 8:00, double-bookings,
+    and weekly hours above an employee's max hours are all reported, as are
+    lines that can't be read. A header line is skipped.
+
+    To plan staff combinations, --partners lists, for each employee, the k
+    coworkers whose workable hours overlap theirs the most, along with how
+    many of those hours both prefer to work. Overlap is counted across the
+    week, or on one day with --day; --name limits the list to one employee.
+
+    At the start of a quarter, --bundle writes the whole packet at once into
+    the given directory: the by-time and by-employee views for every day, and
+    a sheet of the week for every employee. Each day is only parsed once.
+
     These usage patterns are listed above in "Usage."
 
 Configuring employees to ignore:
@@ -70,7 +105,17 @@ Configuring employees to ignore:
     This is included in .gitignore so that it remains private. 
 """
 
+import csv
+import heapq
+import os
+import re
+import sys
+from array import array
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from itertools import accumulate
+
 from docopt import docopt
 
 try:
@@ -78,6 +123,146 @@ try:
 except ImportError:
     EMPLS_TO_IGNORE = []
 
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+
+# Shifts must be at least this long; it can be raised if it is necessary to
+# fill longer shifts.
+MIN_SHIFT_LENGTH_HOURS = 1.5
+
+# One row of the --tightest report; start and end are HH:MM strings.
+Window = namedtuple("Window", ["day", "start", "end",
+                               "min_available", "avg_available",
+                               "min_prefers", "avg_prefers"])
+
+# One shift of a draft schedule; start and end are HH:MM strings.
+Shift = namedtuple("Shift", ["name", "day", "start", "end"])
+
+
+class DayPrefs:
+    """ Every employee's prefs for one day, stored compactly.
+
+    A day keeps the employees' (interned) names in one list, their max hours
+    in one array (NaN where unset), and their prefs strings back to back in
+    one bytes buffer, each padded with spaces to the same stride. That comes
+    to a few dozen bytes per employee-day.
+
+    It behaves like a list of Employee records: indexing, slicing and
+    iterating all hand out lightweight views into the day. Prefs strings are
+    decoded from the buffer each time they are asked for, and not kept. The
+    run_lengths() tables for the whole day are built together, in one pass,
+    the first time any employee's are needed.
+    """
+
+    __slots__ = ("names", "max_hours", "_buf", "_stride", "_lengths", "_runs")
+
+    def __init__(self, names, max_hours, pstrings):
+        self.names = names
+        self.max_hours = array("d", (float("nan") if hours is None else hours
+                                     for hours in max_hours))
+        self._stride = max((len(pstring) for pstring in pstrings), default=0)
+        self._buf = b"".join(pstring.ljust(self._stride).encode("ascii")
+                             for pstring in pstrings)
+        self._lengths = array("H", (len(pstring) for pstring in pstrings))
+        self._runs = None
+
+    def prefs(self, index):
+        """ The prefs string of the employee at 'index'. """
+
+        start = index * self._stride
+        stop = start + self._lengths[index]
+        return self._buf[start:stop].decode("ascii")
+
+    def slot_counts(self, chars):
+        """ How many employees' prefs are in 'chars', for each slot. """
+
+        # Every stride-th byte of the buffer is the same slot of the day
+        stride = self._stride
+        return [sum(self._buf[slot::stride].count(char.encode("ascii"))
+                    for char in chars)
+                for slot in range(stride)]
+
+    def runs(self, index):
+        """ The run_lengths() tables of the employee at 'index'. """
+
+        if self._runs is None:
+            # Runs can't be longer than the day, so bytes do for most days
+            typecode = "B" if self._stride < 256 else "H"
+            text = self._buf.decode("ascii")
+            workable, preferred = array(typecode), array(typecode)
+
+            # Tables are built from each employee's own prefs, without the
+            # padding, and then padded with zeros to stride + 1 entries
+            for i, length in enumerate(self._lengths):
+                start = i * self._stride
+                runs = run_lengths(text[start : start + length])
+                padding = [0] * (self._stride - length)
+                workable.extend(runs[0])
+                workable.extend(padding)
+                preferred.extend(runs[1])
+                preferred.extend(padding)
+
+            self._runs = memoryview(workable), memoryview(preferred)
+
+        # Hand out just the employee's own length, plus the trailing 0
+        workable, preferred = self._runs
+        start = index * (self._stride + 1)
+        stop = start + self._lengths[index] + 1
+
+        return workable[start:stop], preferred[start:stop]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Employee(self, i) for i in range(len(self))[index]]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("employee index out of range")
+
+        return Employee(self, index)
+
+    def __iter__(self):
+        return (Employee(self, i) for i in range(len(self)))
+
+
+class Employee:
+    """ One employee's prefs on one day; a view into a DayPrefs. """
+
+    __slots__ = ("_day", "_index")
+
+    def __init__(self, day, index):
+        self._day = day
+        self._index = index
+
+    @property
+    def name(self):
+        """ The employee's name, shared across days. """
+        return self._day.names[self._index]
+
+    @property
+    def max_hours(self):
+        """ The employee's max hours a week, from sc(..), or None. """
+        hours = self._day.max_hours[self._index]
+        return None if hours != hours else hours
+
+    @property
+    def prefs(self):
+        """ The employee's prefs string (see module docstring). """
+        return self._day.prefs(self._index)
+
+    @property
+    def runs(self):
+        """ The employee's (workable, preferred) run_lengths() tables. """
+        return self._day.runs(self._index)
+
+    def __repr__(self):
+        return "Employee(name={0!r}, prefs={1!r})".format(self.name,
+                                                          self.prefs)
+
+
 def read_prefs_file(day):
     """ Reads the prefs file for 'day' and returns the line-by-line text. """
 
@@ -97,15 +282,15 @@ def combine_lines(lines):
     that is itself taken directly from the WhenToWork source.
 
     This function combines lines for the same employee, outputting a list of
-    namedtuples ("name", "prefs).
+    (name, max hours, prefs line) tuples; max hours is None if not set. Names
+    are interned, so the same employee on different days shares a single name
+    string.
     """
 
     # Some lines have <script> or </script> tags, so get rid of those
     for i, line in enumerate(lines):
         lines[i] = line.replace("<script>", "").replace("</script>", "")
 
-    # Create Employee struct, and list of employees
-    Employee = namedtuple("Employee", ["name", "prefs"])
     empls = []
 
     for line in lines:
@@ -120,13 +305,23 @@ def combine_lines(lines):
             # Splitting again at " lets us get the name itself as the 1st entry
             # -> ['nm2(', 'First Last', ',', '', ',2,', 'id', ')']
             # -> 'First Last'
+            # The max hours are in sc() as the 1st entry, in the same way.
+            # -> ['sc(', '40', ')'] -> '40'
+            # Missing or unreadable max hours are left as None.
             line_parts = line.split(";")
-            name = line_parts[0].split('"')[1]
+            name = sys.intern(line_parts[0].split('"')[1])
+
+            max_hours = None
+            if len(line_parts) > 1 and line_parts[1][:2] == "sc":
+                try:
+                    max_hours = float(line_parts[1].split('"')[1])
+                except (IndexError, ValueError):
+                    pass
 
         if line[:2] == "tb" or line[:2] == "tc":
             # Lines that start with tb or tc are the prefs string.
             # We have 'name' from the previous loop iteration.
-            empls.append(Employee(name, line))
+            empls.append((name, max_hours, line))
 
     return empls
 
@@ -243,72 +438,148 @@ def get_day_prefs(day):
     Given a day of the week, this function reads the prefs file for that day,
     parses it into employees and prefs, and converts each set of prefs to a
     prefs string.
+
+    Returns a DayPrefs, which can be used as a list of Employee records.
     """
 
     # See tests/test_prefs.txt for structure of the prefs file
     # Get file; first three lines are garbage; last three lines are garbage
     lines = read_prefs_file(day)[3:-4]
-    empls = combine_lines(lines)
-
-    # Replace each entry in empls with a new namedtuple; we can't modify the
-    # tuples directly.
-    Employee = namedtuple("Employee", ["name", "prefs"])
-    for i, empl in enumerate(empls):
-        # Ignore certain employees by setting their prefs to never working
-        if empl.name in EMPLS_TO_IGNORE:
-            empls[i] = Employee(empl.name, 'C' * 48)
-            continue
-        
-        empls[i] = Employee(empl.name, prefs_line_to_string(empl.prefs))
 
-    return empls
+    # Convert each prefs line as we go, so the raw lines can be dropped as
+    # soon as they're read. Ignored employees are filled in afterwards.
+    names, max_hours, pstrings = [], [], []
+    for name, hours, line in combine_lines(lines):
+        names.append(name)
+        max_hours.append(hours)
+        if name in EMPLS_TO_IGNORE:
+            pstrings.append(None)
+        else:
+            pstrings.append(prefs_line_to_string(line))
 
+    # Ignore certain employees by setting their prefs to never working, for
+    # as long as everyone else's day is (48 slots if there is no one else)
+    day_length = max((len(pstring) for pstring in pstrings if pstring),
+                     default=48)
+    pstrings = ['C' * day_length if pstring is None else pstring
+                for pstring in pstrings]
 
-def read_prefs_string(pstring):
-    """ Read an employee prefs string to print their availability.
+    return DayPrefs(names, max_hours, pstrings)
 
-    This looks for periods of 1.5 hours (minimum shift length) where an
-    employee prefers or has no preference working, ignoring times they dislike
-    or cannot work. The results are printed out.
 
-    Shifts also start on the half hour, so this iterates through the string
-    in increments of two 15-minute elements.
+def run_lengths(pstring):
+    """ Lengths of the workable and preferred runs starting at each slot.
 
-    While the minimum shift length defaults to 1.5 hours (6 chars), but
-    this can be changed if it is necessary to fill a longer shift.
+    Returns two tuples indexed by slot: how many slots in a row, starting
+    there, the employee can work (X or P), and how many they prefer to work
+    (P). Each has a trailing 0 for the end of the string. Both are built in
+    one backward pass, so whether someone can (or prefers to) work a shift of
+    any length is then a single lookup.
+
+    Parsed employees keep these tables (see Employee.runs), so this only
+    needs to be called directly for a bare prefs string.
+
+    >>> run_lengths('XPPDX')
+    ((3, 2, 1, 0, 1, 0), (0, 2, 1, 0, 0, 0))
+    """
+
+    workable = [0] * (len(pstring) + 1)
+    preferred = [0] * (len(pstring) + 1)
+
+    for i in range(len(pstring) - 1, -1, -1):
+        if pstring[i] == "X" or pstring[i] == "P":
+            workable[i] = workable[i + 1] + 1
+        if pstring[i] == "P":
+            preferred[i] = preferred[i + 1] + 1
+
+    return tuple(workable), tuple(preferred)
+
+
+def shift_lengths(workable, index):
+    """ Every shift length, in hours, that can start at slot 'index'.
+
+    'workable' is the first of the run_lengths() tables. Shifts last at least
+    MIN_SHIFT_LENGTH_HOURS and grow by half hours.
     """
 
-    # Configure minimum shift length
-    MIN_SHIFT_LENGTH_HOURS = 1.5
     num_chars = int(MIN_SHIFT_LENGTH_HOURS * 4)
 
-    time = 8.00
+    return [length / 4 for length in range(num_chars, workable[index] + 1, 2)]
 
-    for i, char in enumerate(pstring):
-        # Iterate by two characters, so skip odd indices
-        if i % 2 == 1:
-            continue
 
-        # When we reach 6 chars from the end of the string, break
-        if i + 6 > len(pstring):
-            break
+def hours_available(workable, index):
+    """ How long someone can work from slot 'index', in hours (or 0).
+
+    'workable' is the first of the run_lengths() tables. They can work if
+    their run is at least a shift long, or else if it runs all the way to the
+    end of the day.
+    """
+
+    num_slots = len(workable) - 1
+    num_chars = int(MIN_SHIFT_LENGTH_HOURS * 4)
+
+    if index >= num_slots:
+        return 0
+
+    if workable[index] < min(num_chars, num_slots - index):
+        return 0
+
+    return workable[index] * 0.25
+
+
+def read_runs(workable, preferred, lengths=False, file=None):
+    """ Prints availability from an employee's run_lengths() tables.
+
+    See read_prefs_string(), which this does the work for.
+    """
+
+    num_chars = int(MIN_SHIFT_LENGTH_HOURS * 4)
 
+    # Iterate by two characters, stopping a shift length from the end
+    for i in range(0, len(workable) - num_chars, 2):
+        time = 8.00 + i / 4
         time1 = decimal_to_time(time)
-        time2 = decimal_to_time(time + 1.5)
+        time2 = decimal_to_time(time + MIN_SHIFT_LENGTH_HOURS)
 
         # Check if they prefer this time
-        if pstring[i : i+num_chars] == 'PPPPPP':
-            print("Prefers to work: {0} - {1}".format(time1, time2))
+        if preferred[i] >= num_chars:
+            line = "Prefers to work: {0} - {1}".format(time1, time2)
 
         # Check that they can work this time (ignoring dislikes / cannot)
-        elif can_work(pstring, decimal_to_time(time)):
-            print("Can work: {0} - {1}".format(time1, time2))
+        elif workable[i] >= num_chars:
+            line = "Can work: {0} - {1}".format(time1, time2)
+
+        else:
+            continue
 
-        time += 0.5
+        if lengths:
+            hours = ", ".join(str(hrs) for hrs in shift_lengths(workable, i))
+            line += " (lengths: {0} hours)".format(hours)
+
+        print(line, file=file)
 
     return
 
 
+def read_prefs_string(pstring, lengths=False, file=None):
+    """ Read an employee prefs string to print their availability.
+
+    This looks for periods of 1.5 hours (minimum shift length) where an
+    employee prefers or has no preference working, ignoring times they dislike
+    or cannot work. The results are printed out.
+
+    Shifts also start on the half hour, so this iterates through the string
+    in increments of two 15-minute elements.
+
+    While the minimum shift length defaults to 1.5 hours (6 chars), but
+    this can be changed (MIN_SHIFT_LENGTH_HOURS) if it is necessary to fill a
+    longer shift. With 'lengths', every shift length that could start at each
+    time is listed as well. Output goes to 'file' (default stdout).
+    """
+
+    read_runs(*run_lengths(pstring), lengths=lengths, file=file)
+
+
 def can_work(pstring, time):
     """ Checks if employee can work at 'time'.
 
@@ -320,79 +591,93 @@ def can_work(pstring, time):
     time = time_to_decimal(time)
     index = int((time - 8.00) * 4)
 
-    # Check if they cannot work; return 0 if so
-    if "C" in pstring[index : index+6] or "D" in pstring[index : index+6]:
-        return 0
-
-    # Otherwise, figure out how long they can work for; once a cannot / dislike
-    # is hit, terminate and return the difference in hours.
-    # Start the iteration through the prefs string at the relevant time, and
-    # for simplicity, also start the counter at the same index.
-    for ind, char in enumerate(pstring[index:], start=index):
-        if char == "C" or char == "D":
-            return (ind - index) * 0.25
-
-    # If we exhaust the string, return difference in hours as well; the +1 is
-    # to account for the extra iteration that we would get if we weren't at the
-    # end of the string.
-    return (ind - index + 1) * 0.25
+    workable, _ = run_lengths(pstring)
+    return hours_available(workable, index)
 
 
-def when_employee_available(day, name):
-    """ Prints availability of a given employee 'name' on 'day'. """
-
-    employees = get_day_prefs(day)
+def print_empl_available(employees, name, file=None):
+    """ Prints availability of employee 'name' among 'employees'. """
 
     for empl in employees:
         if empl.name == name:
-            read_prefs_string(empl.prefs)
+            read_runs(*empl.runs, file=file)
 
 
-def day_available_by_empl(day):
-    """ Prints availability of all employees on 'day'. """
+def print_empl_week(week, name, file=None):
+    """ Prints availability of employee 'name' on every day in 'week'. """
 
-    employees = get_day_prefs(day)
+    print(name, file=file)
+    for day, employees in week.items():
+        print(day.title(), file=file)
+        print_empl_available(employees, name, file)
+        print(file=file)
+
+
+def print_by_empl(employees, lengths=False, file=None):
+    """ Prints availability of all 'employees'. """
 
     for empl in employees:
-        print(empl.name)
-        read_prefs_string(empl.prefs)
-        print()
+        print(empl.name, file=file)
+        read_runs(*empl.runs, lengths, file)
+        print(file=file)
 
 
-def day_available_by_time(day):
-    """ Prints availability at all times on 'day'. """
+def print_by_time(employees, file=None):
+    """ Prints availability of 'employees' at all times. """
 
-    employees = get_day_prefs(day)
     times = ["8:00", "8:30", "9:00", "9:30", "10:00", "10:30", "11:00", 
              "11:30", "12:00", "12:30", "1:00", "1:30", "2:00", "2:30",
              "3:00", "3:30", "4:00", "4:30", "5:00", "5:30", "6:00", "6:30"]
 
+    # Look each employee's run table up once, rather than once per time
+    tables = [(empl.name, empl.runs[0]) for empl in employees]
+
     for time in times:
-        print("Shifts starting at {0}".format(time))
+        print("Shifts starting at {0}".format(time), file=file)
+        index = int((time_to_decimal(time) - 8.00) * 4)
         count = 0
 
-        for empl in employees:
-            hours_av = can_work(empl.prefs, time)
+        for name, workable in tables:
+            hours_av = hours_available(workable, index)
 
             if hours_av:
                 end_time = decimal_to_time(time_to_decimal(time) + hours_av)
-                print("{0}, until {1}".format(empl.name, end_time))
+                print("{0}, until {1}".format(name, end_time), file=file)
                 count += 1
 
-        print("{0} employees available\n".format(count))
+        print("{0} employees available\n".format(count), file=file)
+
+
+def when_employee_available(day, name):
+    """ Prints availability of a given employee 'name' on 'day'. """
+
+    print_empl_available(get_day_prefs(day), name)
+
+
+def day_available_by_empl(day, lengths=False):
+    """ Prints availability of all employees on 'day'. """
+
+    print_by_empl(get_day_prefs(day), lengths)
+
+
+def day_available_by_time(day):
+    """ Prints availability at all times on 'day'. """
+
+    print_by_time(get_day_prefs(day))
 
 
 def who_can_work(day, time):
     """ Prints those who can work, and for how long, on 'day' at 'time'. """
 
     employees = get_day_prefs(day)
+    index = int((time_to_decimal(time) - 8.00) * 4)
 
     for empl in employees:
-        hours_available = can_work(empl.prefs, time)
+        hours_av = hours_available(empl.runs[0], index)
 
-        # hours_available is either 0 or an amount of time they can work
-        if hours_available:
-            time2 = decimal_to_time(time_to_decimal(time) + hours_available)
+        # hours_av is either 0 or an amount of time they can work
+        if hours_av:
+            time2 = decimal_to_time(time_to_decimal(time) + hours_av)
             print("{0}, from {1} until {2}".format(empl.name, time, time2))
 
 
@@ -401,7 +686,7 @@ def hours_by_empl(day=None):
 
     # Default: calculate for all days. Otherwise, just do the one
     if day is None:
-        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+        days = DAYS
     else:
         days = [day]
 
@@ -417,24 +702,480 @@ def hours_by_empl(day=None):
     return
 
 
+def slot_coverage(employees):
+    """ Counts how many employees can and prefer to work in each slot.
+
+    Returns two lists indexed by 15-minute slot (starting at 8:00): the number
+    of employees who can work then (X or P), and who prefer to (P). These are
+    counted straight from the day's prefs buffer, a slot at a time.
+    """
+
+    if not isinstance(employees, DayPrefs):
+        employees = DayPrefs([empl.name for empl in employees],
+                             [empl.max_hours for empl in employees],
+                             [empl.prefs for empl in employees])
+
+    return employees.slot_counts("XP"), employees.slot_counts("P")
+
+
+def window_scarcity(available, prefers):
+    """ Yields staffing numbers for every possible shift window in a day.
+
+    Windows start on the half hour, last at least MIN_SHIFT_LENGTH_HOURS, and
+    grow half an hour at a time. Each one is yielded as a tuple
+        (start, stop, min available, avg available, min prefers, avg prefers)
+    where start and stop are slot indices, as from slot_coverage(), and the
+    minimums are the fewest employees in any one slot of the window.
+
+    Averages come from prefix sums over the coverage. Minimums are taken once
+    for each half hour, then carried along as each window grows from its
+    start, so no slot is scanned twice for the same start.
+    """
+
+    min_halves = (int(MIN_SHIFT_LENGTH_HOURS * 4) + 1) // 2
+    available_sums = [0] + list(accumulate(available))
+    prefers_sums = [0] + list(accumulate(prefers))
+
+    # Fewest available (and preferring) in each half hour of the day
+    halves = len(available) // 2
+    half_available = [min(available[2 * h : 2 * h + 2]) for h in range(halves)]
+    half_prefers = [min(prefers[2 * h : 2 * h + 2]) for h in range(halves)]
+
+    for first in range(halves - min_halves + 1):
+        start = 2 * first
+        min_available = half_available[first]
+        min_prefers = half_prefers[first]
+
+        for half in range(first, halves):
+            if half_available[half] < min_available:
+                min_available = half_available[half]
+            if half_prefers[half] < min_prefers:
+                min_prefers = half_prefers[half]
+
+            # Only windows at least a minimum shift long
+            if half - first + 1 < min_halves:
+                continue
+
+            stop = 2 * half + 2
+            length = stop - start
+            avg_available = (available_sums[stop] - available_sums[start])
+            avg_prefers = (prefers_sums[stop] - prefers_sums[start])
+
+            yield (start, stop, min_available, avg_available / length,
+                   min_prefers, avg_prefers / length)
+
+
+def tightest_windows(week, n=10):
+    """ Ranks the 'n' tightest shift windows across the days in 'week'.
+
+    'week' maps each day to its employees (as from get_day_prefs()). A window
+    is tighter the fewer employees are available in its scarcest slot (not
+    necessarily the same people throughout the window); ties are broken by
+    the average number available, then by the same numbers for those who
+    prefer to work. Returns a list of Windows, tightest first.
+    """
+
+    def windows():
+        for day, employees in week.items():
+            for window in window_scarcity(*slot_coverage(employees)):
+                yield window[2:], day, window[0], window[1]
+
+    tightest = heapq.nsmallest(n, windows(), key=lambda window: window[0])
+
+    return [Window(day, decimal_to_time(8.00 + start / 4),
+                   decimal_to_time(8.00 + stop / 4), *stats)
+            for stats, day, start, stop in tightest]
+
+
+def print_tightest_windows(n, day=None):
+    """ Prints the 'n' tightest windows on 'day' (default all days). """
+
+    days = DAYS if day is None else [day]
+    week = {day: get_day_prefs(day) for day in days}
+
+    for window in tightest_windows(week, n):
+        print("{0} {1} - {2}: {3} available (avg {4:.1f}), "
+              "{5} prefer (avg {6:.1f})".format(window.day.title(),
+                                                window.start, window.end,
+                                                window.min_available,
+                                                window.avg_available,
+                                                window.min_prefers,
+                                                window.avg_prefers))
+
+
+def prefs_mask(pstring, chars):
+    """ Bitmask of the slots in 'pstring' whose character is in 'chars'.
+
+    Bit i is set when the i-th 15-minute slot matches, so that whole shifts
+    can be checked against prefs with a single & of two masks.
+
+    >>> bin(prefs_mask('XXCCDX', 'CD'))
+    '0b11100'
+    """
+
+    bits = ''.join('1' if char in chars else '0' for char in reversed(pstring))
+    return int(bits, 2) if bits else 0
+
+
+def is_time(text):
+    """ Checks that 'text' is a time in the form HH:MM, on the quarter hour.
+
+    >>> is_time('1:30'), is_time('2:07'), is_time('13:5'), is_time('start')
+    (True, False, False, False)
+    """
+
+    return re.fullmatch(r"\d{1,2}:(00|15|30|45)", text) is not None
+
+
+def read_schedule_file(fname):
+    """ Reads a draft schedule file, returning (shifts, problems).
+
+    Each non-blank line is employee, day, start, end, separated by commas. A
+    first line with no digits in its start is taken to be a header and skipped.
+    Lines that can't be read are left out of the shifts, and described (with
+    their line numbers) in the list of problems instead.
+    """
+
+    shifts = []
+    problems = []
+
+    with open(fname, newline='') as f:
+        for lineno, row in enumerate(csv.reader(f), start=1):
+            row = [field.strip() for field in row]
+            if not any(row):
+                continue
+
+            # Headers name their columns, so have no digits in the start
+            if lineno == 1 and len(row) > 2 and not re.search(r"\d", row[2]):
+                continue
+
+            if len(row) != 4:
+                problems.append("Line {0}: expected employee, day, start, "
+                                "end".format(lineno))
+            elif row[1].lower() not in DAYS:
+                problems.append("Line {0}: unknown day '{1}'".format(lineno,
+                                                                     row[1]))
+            elif not is_time(row[2]) or not is_time(row[3]):
+                problems.append("Line {0}: times must be HH:MM, on the quarter "
+                                "hour".format(lineno))
+            else:
+                shifts.append(Shift(row[0], row[1].lower(), row[2], row[3]))
+
+    return shifts, problems
+
+
+def validate_schedule(shifts, week):
+    """ Checks each shift in a draft schedule against the prefs in 'week'.
+
+    'week' maps each day to its employees (as from get_day_prefs()). Every
+    employee's cannot-work and dislikes masks are built once, after which each
+    check is a single mask intersection. Returns a list of problems found, as
+    human-readable strings, in schedule order.
+    """
+
+    num_chars = int(MIN_SHIFT_LENGTH_HOURS * 4)
+
+    # (name, day) -> (cannot work mask, dislikes mask, Employee)
+    masks = {}
+    for day, employees in week.items():
+        for empl in employees:
+            pstring = empl.prefs
+            masks[(empl.name, day)] = (prefs_mask(pstring, "C"),
+                                       prefs_mask(pstring, "D"), empl)
+
+    problems = []
+    booked = {}
+    hours = {}
+    max_hours = {}
+
+    for shift in shifts:
+        label = "{0}, {1} {2} - {3}".format(shift.name, shift.day.title(),
+                                            shift.start, shift.end)
+
+        if (shift.name, shift.day) not in masks:
+            problems.append("{0}: no prefs found".format(label))
+            continue
+
+        cannot, dislikes, empl = masks[(shift.name, shift.day)]
+
+        # Shifts can end at 8:00 pm, which would otherwise read as 8:00 am;
+        # other ends before the start wrap around too, and so fall outside
+        start = time_to_decimal(shift.start)
+        end = time_to_decimal(shift.end)
+        if end < start:
+            end += 12
+
+        first, last = int((start - 8.00) * 4), int((end - 8.00) * 4)
+
+        if last <= first:
+            problems.append("{0}: zero or negative length".format(label))
+            continue
+        shift_mask = ((1 << (last - first)) - 1) << max(first, 0)
+
+        if first < 0 or last > len(empl.prefs):
+            problems.append("{0}: outside of 8:00 - 8:00".format(label))
+
+        if last - first < num_chars:
+            problems.append("{0}: shorter than {1} hours".format(
+                label, MIN_SHIFT_LENGTH_HOURS))
+
+        if shift_mask & cannot:
+            problems.append("{0}: overlaps times they cannot work".format(label))
+
+        if shift_mask & dislikes:
+            problems.append("{0}: overlaps times they dislike".format(label))
+
+        key = (shift.name, shift.day)
+        if shift_mask & booked.get(key, 0):
+            problems.append("{0}: overlaps another shift".format(label))
+
+        booked[key] = booked.get(key, 0) | shift_mask
+        hours[shift.name] = hours.get(shift.name, 0) + (last - first) / 4
+        max_hours[shift.name] = empl.max_hours
+
+    for name, total in hours.items():
+        if max_hours[name] is not None and total > max_hours[name]:
+            problems.append("{0}: {1} hours scheduled, above max of {2}".format(
+                name, total, max_hours[name]))
+
+    return problems
+
+
+def check_schedule(fname):
+    """ Prints any problems with the draft schedule in 'fname'. """
+
+    shifts, problems = read_schedule_file(fname)
+    days = sorted({shift.day for shift in shifts}, key=DAYS.index)
+    week = {day: get_day_prefs(day) for day in days}
+
+    problems += validate_schedule(shifts, week)
+    for problem in problems:
+        print(problem)
+
+    print("{0} problems found".format(len(problems)))
+
+
+def write_report(path, text):
+    """ Writes the finished report 'text' to 'path'. """
+
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def render_report(printer, *args):
+    """ Runs 'printer' on 'args', returning what it prints as a string. """
+
+    out = StringIO()
+    printer(*args, file=out)
+    return out.getvalue()
+
+
+def safe_fname(name):
+    """ Turns an employee's name into a safe file name stem.
+
+    >>> safe_fname(" Anne-Marie O'Neil / TA ")
+    'anne_marie_o_neil_ta'
+    """
+
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "employee"
+
+
+def write_bundle(outdir, week, workers=8):
+    """ Writes every availability report for 'week' into 'outdir'.
+
+    'week' maps each day to its employees (as from get_day_prefs()), so every
+    day is parsed only once. For each day, this writes the by-time and
+    by-employee views (monday_by_time.txt, monday_by_empl.txt, ...), and for
+    each employee a sheet of their week (first_last.txt, numbered first_last_2
+    and so on if two names come out the same).
+
+    Reports are rendered here from the shared data, and handed to a pool of
+    'workers' threads to be written out while the next ones are rendered.
+    Returns the list of paths written.
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+
+    reports = []
+    for day, employees in week.items():
+        reports.append((day + "_by_time.txt", print_by_time, employees))
+        reports.append((day + "_by_empl.txt", print_by_empl, employees))
+
+    names = dict.fromkeys(empl.name for employees in week.values()
+                          for empl in employees)
+    used = {fname for fname, *_ in reports}
+    for name in names:
+        stem = safe_fname(name)
+        fname, count = stem + ".txt", 1
+        while fname in used:
+            count += 1
+            fname = "{0}_{1}.txt".format(stem, count)
+
+        used.add(fname)
+        reports.append((fname, print_empl_week, week, name))
+
+    paths = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        writes = []
+        for fname, printer, *args in reports:
+            path = os.path.join(outdir, fname)
+            text = render_report(printer, *args)
+            writes.append(pool.submit(write_report, path, text))
+            paths.append(path)
+
+        # Surface any errors from writing
+        for write in writes:
+            write.result()
+
+    return paths
+
+
+def bundle_reports(outdir):
+    """ Writes every report for the week into 'outdir'. """
+
+    week = {day: get_day_prefs(day) for day in DAYS}
+    paths = write_bundle(outdir, week)
+
+    print("{0} reports written to {1}".format(len(paths), outdir))
+
+
+def co_availability(week, chars="XP", per_day=True):
+    """ Hours every pair of employees overlap, per day and across the week.
+
+    'week' maps each day to its employees (as from get_day_prefs()). A slot
+    counts toward a pair when both employees' prefs there are in 'chars', so
+    the default counts workable time and "P" counts mutually preferred time.
+
+    Each employee-day is a bitmask over slots, so a day's matrix is one
+    "product" of the employees x slots masks with themselves: row i, column j
+    is the popcount of mask i & mask j, in hours (int.bit_count needs Python
+    3.10). Returns
+        (names, {day: matrix}, week matrix)
+    where each matrix is a list of rows indexed like 'names'; the diagonal
+    holds each employee's own hours.
+
+    The week matrix is one product over each employee's days laid end to end
+    in a single mask (or a copy of the day's matrix, if there is only one).
+    Without 'per_day', the day matrices are skipped and {} is returned for
+    them.
+    """
+
+    names = list(dict.fromkeys(empl.name for employees in week.values()
+                               for empl in employees))
+
+    # The matrix is symmetric, so only popcount from the diagonal on; the
+    # rest of each row is the same column of the rows above it
+    def product(masks):
+        matrix = []
+        for i, mask in enumerate(masks):
+            lower = [row[i] for row in matrix]
+            matrix.append(lower + [(mask & other).bit_count() / 4
+                                   for other in masks[i:]])
+        return matrix
+
+    by_day = {}
+    week_masks = [0] * len(names)
+    offset = 0
+
+    for day, employees in week.items():
+        day_masks = {empl.name: prefs_mask(empl.prefs, chars)
+                     for empl in employees}
+        masks = [day_masks.get(name, 0) for name in names]
+
+        if per_day:
+            by_day[day] = product(masks)
+
+        # Shift this day past the slots of the days before it
+        for i, mask in enumerate(masks):
+            week_masks[i] |= mask << offset
+        offset += max((len(empl.prefs) for empl in employees), default=0)
+
+    if len(by_day) == 1:
+        total = [list(row) for row in next(iter(by_day.values()))]
+    else:
+        total = product(week_masks)
+
+    return names, by_day, total
+
+
+def top_partners(names, matrix, name, k):
+    """ The 'k' employees who overlap most with 'name' in 'matrix'.
+
+    Returns a list of (name, hours), most hours first, leaving out 'name'.
+    """
+
+    row = matrix[names.index(name)]
+    partners = [(other, hours) for other, hours in zip(names, row)
+                if other != name]
+
+    return heapq.nlargest(k, partners, key=lambda partner: partner[1])
+
+
+def print_partners(k, day=None, name=None):
+    """ Prints top 'k' partners of each empl (or 'name') on 'day' (or all). """
+
+    days = DAYS if day is None else [day]
+    week = {day: get_day_prefs(day) for day in days}
+
+    names, _, workable = co_availability(week, per_day=False)
+    _, _, preferred = co_availability(week, "P", per_day=False)
+    preferred = {other: row for other, row in zip(names, preferred)}
+
+    for empl in names:
+        if name is not None and empl != name:
+            continue
+
+        print(empl)
+        mutual = dict(zip(names, preferred[empl]))
+
+        for partner, hours in top_partners(names, workable, empl, k):
+            print("{0}: {1} hours ({2} preferred)".format(partner, hours,
+                                                          mutual[partner]))
+        print()
+
+
 if __name__ == "__main__":
     args = docopt(__doc__)
 
     day, time, name = args["--day"], args["--time"], args["--name"]
     byemplflag, helpflag = args["--byempl"], args["--help"]
-    countflag = args["--count"]
+    lengthsflag = args["--lengths"]
+    countflag, tightest = args["--count"], args["--tightest"]
+    schedule, partners = args["--validate"], args["--partners"]
+    bundle = args["--bundle"]
 
     # Convert day to lowercase
     if day:
         day = day.lower()
 
-    valid_days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+    valid_days = DAYS
 
     # If they ask for help, or don't specify other options, display docs
-    if helpflag or (not day and not time and not name):
+    if helpflag or (not day and not time and not name and not tightest
+                     and not schedule and not partners and not bundle):
         print(__doc__)
 
-    if countflag:
+    if bundle:
+        bundle_reports(bundle)
+
+    elif schedule:
+        check_schedule(schedule)
+
+    elif partners:
+        # Restrict to that day if they specify one, otherwise all week
+        if day in valid_days:
+            print_partners(int(partners), day, name)
+        else:
+            print_partners(int(partners), name=name)
+
+    elif tightest:
+        # Rank windows on that day if they specify one, otherwise all week
+        if day in valid_days:
+            print_tightest_windows(int(tightest), day)
+        else:
+            print_tightest_windows(int(tightest))
+
+    elif countflag:
         # If they specify a day and the count flag, count hours for that day
         if day in valid_days:
             hours_by_empl(day)
@@ -454,16 +1195,13 @@ if __name__ == "__main__":
 
         # If they specify availability by empl, do that
         elif byemplflag:
-            day_available_by_empl(day)
+            day_available_by_empl(day, lengthsflag)
 
         # Otherwise, find all available on that day by time
         else:
             day_available_by_time(day)
 
     # If they just specify a name, print that person's availability all week.
-    if name and not day:
-        print(name)
-        for day in valid_days:
-            print(day.title())
-            when_employee_available(day, name)
-            print()
\ No newline at end of file
+    if name and not day and not partners:
+        week = {day: get_day_prefs(day) for day in valid_days}
+        print_empl_week(week, name)
\ No newline at end of file
@@ -2,6 +2,9 @@ from .. import scheduler
 
 from collections import namedtuple
 from io import StringIO
+import os
+import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
@@ -17,14 +20,26 @@ class TestPrefsReader(unittest.TestCase):
                  'tc(0,5,"3");'
                  ]
 
-        Employee = namedtuple("Employee", ["name", "prefs"])
-        expected_empls = [Employee('Test Employee', 'tb(0,4);lorem;ipsum;'),
-                          Employee('Test Another', 'tc(0,5,"3");')]
+        Employee = namedtuple("Employee", ["name", "max_hours", "prefs"])
+        expected_empls = [Employee('Test Employee', 40.0, 'tb(0,4);lorem;ipsum;'),
+                          Employee('Test Another', 50.0, 'tc(0,5,"3");')]
 
         combined = scheduler.combine_lines(lines)
         print (combined)
         assert combined == expected_empls
 
+    def test_combine_lines_bad_max_hours(self):
+        """ Test combine_lines() leaves unreadable max hours as None. """
+
+        lines = ['nm2("Test Employee","",2,"id");sc("lots");',
+                 'tb(0,4);',
+                 'nm2("Test Another","",3,"id");sc();',
+                 'tc(0,5,"3");'
+                 ]
+
+        combined = scheduler.combine_lines(lines)
+        assert [empl[1] for empl in combined] == [None, None]
+
     def test_combine_lines_removes_script_tags(self):
         """ Test combine_lines() removes script tags. """
 
@@ -35,9 +50,9 @@ class TestPrefsReader(unittest.TestCase):
                  'tc(0,5,"3");'
                  ]
 
-        Employee = namedtuple("Employee", ["name", "prefs"])
-        expected_empls = [Employee('Test Employee', 'tb(0,4);lorem;ipsum;'),
-                          Employee('Test Another', 'tc(0,5,"3");')]
+        Employee = namedtuple("Employee", ["name", "max_hours", "prefs"])
+        expected_empls = [Employee('Test Employee', 40.0, 'tb(0,4);lorem;ipsum;'),
+                          Employee('Test Another', 50.0, 'tc(0,5,"3");')]
 
         combined = scheduler.combine_lines(lines)
         print (combined)
@@ -46,14 +61,30 @@ class TestPrefsReader(unittest.TestCase):
     def test_get_day_prefs_simple(self):
         """ Test get_day_prefs() on the dummy set of prefs. """
 
-        Employee = namedtuple("Employee", ["name", "prefs"])
-
         actual_prefs = scheduler.get_day_prefs("test_prefs")
-        expected = [Employee('Some Employee', 'XXXXXXXXXXXXDDDDDDDDPPPPPPCCCCCCCCCCCCCCCCXXXXXX'),
-                    Employee('Test Student', 'XXXXXXCCCCCCCCCCCCCCCCXXPPPPPPPPPPPPPPPPXXXXXXXX')]
+        expected = [('Some Employee', 'XXXXXXXXXXXXDDDDDDDDPPPPPPCCCCCCCCCCCCCCCCXXXXXX'),
+                    ('Test Student', 'XXXXXXCCCCCCCCCCCCCCCCXXPPPPPPPPPPPPPPPPXXXXXXXX')]
 
+        assert [(e.name, e.prefs) for e in actual_prefs] == expected
 
-        assert actual_prefs == expected
+    def test_get_day_prefs_shares_names(self):
+        """ Test get_day_prefs() shares names across days. """
+
+        monday = scheduler.get_day_prefs("test_prefs")
+        tuesday = scheduler.get_day_prefs("test_prefs")
+
+        assert monday[0].name is tuesday[0].name
+        assert monday[0].prefs == tuesday[0].prefs
+        assert not hasattr(monday[0], '__dict__')
+
+    def test_get_day_prefs_max_hours(self):
+        """ Test get_day_prefs() keeps the sc(..) max hours. """
+
+        employees = scheduler.get_day_prefs("test_prefs")
+        assert [e.max_hours for e in employees] == [40.0, 40.0]
+
+        day = scheduler.DayPrefs(['A', 'B'], [37.3, None], ['X', 'X'])
+        assert [e.max_hours for e in day] == [37.3, None]
 
 
 class TestPrefsLineConversion(unittest.TestCase):
@@ -226,6 +257,64 @@ class TestReadPrefsString(unittest.TestCase):
             scheduler.read_prefs_string(employees[1].prefs)
             assert test_output.getvalue().strip() == expected2
 
+    def test_read_prefs_string_lengths(self):
+        """ Test read_prefs_string() listing every shift length. """
+
+        pstring = 'PPPPPPPPXX'
+        expected = 'Prefers to work: 8:00 - 9:30 (lengths: 1.5, 2.0, 2.5 hours)\n' \
+                   'Prefers to work: 8:30 - 10:00 (lengths: 1.5, 2.0 hours)\n' \
+                   'Can work: 9:00 - 10:30 (lengths: 1.5 hours)'
+
+        with patch('sys.stdout', new=StringIO()) as test_output:
+            scheduler.read_prefs_string(pstring, lengths=True)
+            assert test_output.getvalue().strip() == expected
+
+
+class TestRunLengths(unittest.TestCase):
+    """ Tests for run_lengths() and shift_lengths(). """
+
+    def test_run_lengths(self):
+        """ Test run_lengths() on a mixed string. """
+
+        workable, preferred = scheduler.run_lengths('XXPPCPPDX')
+
+        assert workable == (4, 3, 2, 1, 0, 2, 1, 0, 1, 0)
+        assert preferred == (0, 0, 2, 1, 0, 2, 1, 0, 0, 0)
+
+    def test_shift_lengths(self):
+        """ Test shift_lengths() lists half-hour steps up to the run. """
+
+        workable, _ = scheduler.run_lengths('XXXXXXXXXDCC')
+
+        assert scheduler.shift_lengths(workable, 0) == [1.5, 2.0]
+        assert scheduler.shift_lengths(workable, 2) == [1.5]
+        assert scheduler.shift_lengths(workable, 4) == []
+
+    def test_employee_runs(self):
+        """ Test parsed employees carry their run_lengths() tables. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+
+        for empl in employees:
+            workable, preferred = empl.runs
+            expected = scheduler.run_lengths(empl.prefs)
+            assert (tuple(workable), tuple(preferred)) == expected
+
+    def test_employee_runs_unequal_lengths(self):
+        """ Test run tables keep each employee's own day length. """
+
+        day = scheduler.DayPrefs(['A', 'B'], [None, None], ['X' * 36, 'C' * 48])
+        workable, _ = day[0].runs
+
+        assert len(workable) == 37
+        assert scheduler.hours_available(workable, 32) == 1.0
+        assert scheduler.can_work(day[0].prefs, '4:00') == 1.0
+        assert day[0].prefs == 'X' * 36
+
+        with patch('sys.stdout', new=StringIO()) as test_output:
+            scheduler.print_by_time(day)
+            assert 'A, until 5:00' in test_output.getvalue()
+
 
 class TestCanWork(unittest.TestCase):
     """ Tests for can_work(). """
@@ -329,3 +418,272 @@ class TestHours(unittest.TestCase):
         with patch('sys.stdout', new=StringIO()) as test_output:
             scheduler.hours_by_empl('test_prefs')
             assert test_output.getvalue().strip() == expected
+
+
+class TestTightestWindows(unittest.TestCase):
+    """ Test slot_coverage(), window_scarcity() and tightest_windows(). """
+
+    def test_slot_coverage(self):
+        """ Test slot_coverage() counts X and P, but not D or C. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        available, prefers = scheduler.slot_coverage(employees)
+
+        assert available[:14] == [2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 0, 0]
+        assert prefers[20:28] == [1, 1, 1, 1, 2, 2, 1, 1]
+        assert len(available) == len(prefers) == 48
+
+    def test_window_scarcity_simple(self):
+        """ Test window_scarcity() on an eight-slot day. """
+
+        available = [3, 3, 2, 2, 1, 1, 4, 4]
+        prefers = [1, 1, 0, 0, 0, 0, 2, 2]
+        windows = list(scheduler.window_scarcity(available, prefers))
+
+        expected = [(0, 6, 1, 2.0, 0, 1 / 3), (0, 8, 1, 2.5, 0, 0.75),
+                    (2, 8, 1, 7 / 3, 0, 2 / 3)]
+        assert windows == expected
+
+    def test_tightest_windows(self):
+        """ Test tightest_windows() on the test prefs. """
+
+        week = {'test_prefs': scheduler.get_day_prefs('test_prefs')}
+        tightest = scheduler.tightest_windows(week, 3)
+
+        expected = [('11:00', '12:30'), ('11:00', '1:00'), ('11:30', '1:00')]
+        assert [(w.start, w.end) for w in tightest] == expected
+        assert all(w.min_available == 0 for w in tightest)
+
+    def test_tightest_windows_short_day_with_ignored(self):
+        """ Test tightest_windows() doesn't rank slots past the day's end. """
+
+        with patch.object(scheduler, 'EMPLS_TO_IGNORE', ['Some Employee']), \
+             patch.object(scheduler, 'read_prefs_file',
+                          return_value=['', '', '',
+                                        'nm2("Some Employee","",2,"1");',
+                                        'tb(0,36);',
+                                        'nm2("Test Student","",2,"2");',
+                                        'tb(0,36);',
+                                        '', '', '', '']):
+            employees = scheduler.get_day_prefs('monday')
+
+        assert [len(empl.prefs) for empl in employees] == [36, 36]
+
+        tightest = scheduler.tightest_windows({'monday': employees}, 1)
+        assert tightest[0].min_available == 1
+
+    def test_window_scarcity_full_week(self):
+        """ Test window_scarcity() covers every window of a 288-slot day. """
+
+        available = [i % 7 for i in range(288)]
+        prefers = [i % 3 for i in range(288)]
+
+        start = time.perf_counter()
+        for day in range(5):
+            windows = list(scheduler.window_scarcity(available, prefers))
+        elapsed = time.perf_counter() - start
+
+        # Starts every half hour, each ending on any later half hour at
+        # least 1.5 hours on; 142 + 141 + ... + 1 windows in all
+        assert len(windows) == 142 * 143 // 2
+        assert windows[0] == (0, 6, 0, 15 / 6, 0, 1.0)
+        assert elapsed < 1
+
+
+class TestValidateSchedule(unittest.TestCase):
+    """ Test prefs_mask() and validate_schedule(). """
+
+    def test_prefs_mask(self):
+        """ Test prefs_mask() sets a bit for each matching slot. """
+        assert scheduler.prefs_mask('XXCCDX', 'CD') == 0b011100
+        assert scheduler.prefs_mask('XPXP', 'C') == 0
+
+    def test_validate_schedule_clean(self):
+        """ Test validate_schedule() on a schedule with no problems. """
+
+        shifts = [scheduler.Shift('Some Employee', 'monday', '8:00', '11:00'),
+                  scheduler.Shift('Test Student', 'monday', '2:00', '8:00')]
+        week = {'monday': scheduler.get_day_prefs('test_prefs')}
+
+        assert scheduler.validate_schedule(shifts, week) == []
+
+    def test_validate_schedule_conflicts(self):
+        """ Test validate_schedule() flags each kind of conflict. """
+
+        shifts = [scheduler.Shift('Some Employee', 'monday', '10:00', '12:00'),
+                  scheduler.Shift('Some Employee', 'monday', '8:00', '10:30'),
+                  scheduler.Shift('Test Student', 'monday', '1:00', '2:00'),
+                  scheduler.Shift('Nobody', 'monday', '8:00', '9:30'),
+                  scheduler.Shift('Test Student', 'monday', '7:00', '9:00'),
+                  scheduler.Shift('Test Student', 'monday', '2:00', '2:00')]
+        week = {'monday': scheduler.get_day_prefs('test_prefs')}
+
+        expected = ['Some Employee, Monday 10:00 - 12:00: '
+                    'overlaps times they dislike',
+                    'Some Employee, Monday 8:00 - 10:30: '
+                    'overlaps another shift',
+                    'Test Student, Monday 1:00 - 2:00: shorter than 1.5 hours',
+                    'Test Student, Monday 1:00 - 2:00: '
+                    'overlaps times they cannot work',
+                    'Nobody, Monday 8:00 - 9:30: no prefs found',
+                    'Test Student, Monday 7:00 - 9:00: outside of 8:00 - 8:00',
+                    'Test Student, Monday 2:00 - 2:00: '
+                    'zero or negative length']
+
+        assert scheduler.validate_schedule(shifts, week) == expected
+
+    def test_validate_schedule_max_hours(self):
+        """ Test validate_schedule() flags hours above an empl's max. """
+
+        week = {'monday': scheduler.DayPrefs(['Some Employee'], [2.0],
+                                             ['X' * 48])}
+        shifts = [scheduler.Shift('Some Employee', 'monday', '8:00', '9:30'),
+                  scheduler.Shift('Some Employee', 'monday', '6:30', '8:00')]
+
+        expected = ['Some Employee: 3.0 hours scheduled, above max of 2.0']
+        assert scheduler.validate_schedule(shifts, week) == expected
+
+    def test_read_schedule_file(self):
+        """ Test read_schedule_file() skips a header and reports bad lines. """
+
+        text = 'employee,day,start,end\n' \
+               'Test Student,Monday,2:00,4:00\n' \
+               '\n' \
+               'Test Student,monday,2:00\n' \
+               'Test Student,someday,2:00,4:00\n' \
+               'Test Student,monday,two,4:00\n' \
+               'Test Student,monday,2:07,4:00\n'
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'schedule.txt')
+            with open(fname, 'w') as f:
+                f.write(text)
+
+            shifts, problems = scheduler.read_schedule_file(fname)
+
+        assert shifts == [('Test Student', 'monday', '2:00', '4:00')]
+        assert problems == ['Line 4: expected employee, day, start, end',
+                            "Line 5: unknown day 'someday'",
+                            'Line 6: times must be HH:MM, on the quarter hour',
+                            'Line 7: times must be HH:MM, on the quarter hour']
+
+
+class TestCoAvailability(unittest.TestCase):
+    """ Test co_availability() and top_partners(). """
+
+    def test_co_availability_workable(self):
+        """ Test co_availability() counts hours both can work. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        week = {'monday': employees, 'tuesday': employees[:1]}
+        names, by_day, total = scheduler.co_availability(week)
+
+        assert names == ['Some Employee', 'Test Student']
+        assert by_day['monday'] == [[6.0, 4.0], [4.0, 8.0]]
+        assert by_day['tuesday'] == [[6.0, 0.0], [0.0, 0.0]]
+        assert total == [[12.0, 4.0], [4.0, 8.0]]
+
+    def test_co_availability_preferred(self):
+        """ Test co_availability() counts hours both prefer to work. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        week = {'monday': employees, 'tuesday': employees[:1]}
+        names, by_day, total = scheduler.co_availability(week, "P")
+
+        assert by_day['monday'] == [[1.5, 0.5], [0.5, 4.0]]
+        assert total == [[3.0, 0.5], [0.5, 4.0]]
+
+    def test_co_availability_week_only(self):
+        """ Test co_availability() can skip the day matrices. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        week = {'monday': employees, 'tuesday': employees[:1]}
+        _, _, expected = scheduler.co_availability(week)
+        names, by_day, total = scheduler.co_availability(week,
+                                                         per_day=False)
+
+        assert by_day == {}
+        assert total == expected
+
+    def test_co_availability_one_day_copies(self):
+        """ Test co_availability() on one day returns a separate total. """
+
+        week = {'monday': scheduler.get_day_prefs('test_prefs')}
+        names, by_day, total = scheduler.co_availability(week)
+
+        assert total == by_day['monday']
+        total[0][1] = 99
+        assert by_day['monday'][0][1] == 4.0
+
+    def test_top_partners(self):
+        """ Test top_partners() ranks by hours and leaves out the empl. """
+
+        names = ['A', 'B', 'C', 'D']
+        matrix = [[9, 1, 5, 3],
+                  [1, 9, 2, 2],
+                  [5, 2, 9, 0],
+                  [3, 2, 0, 9]]
+
+        assert scheduler.top_partners(names, matrix, 'A', 2) == [('C', 5),
+                                                                 ('D', 3)]
+        assert scheduler.top_partners(names, matrix, 'C', 5) == [('A', 5),
+                                                                 ('B', 2),
+                                                                 ('D', 0)]
+
+
+class TestBundle(unittest.TestCase):
+    """ Test print_empl_week() and write_bundle(). """
+
+    def test_print_empl_week(self):
+        """ Test print_empl_week() prints each day, even without prefs. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        week = {'monday': employees, 'tuesday': employees[1:]}
+
+        expected = 'Some Employee\nMonday\n' \
+                   'Can work: 8:00 - 9:30\nCan work: 8:30 - 10:00\n' \
+                   'Can work: 9:00 - 10:30\nCan work: 9:30 - 11:00\n' \
+                   'Prefers to work: 1:00 - 2:30\nCan work: 6:30 - 8:00\n\n' \
+                   'Tuesday'
+
+        with patch('sys.stdout', new=StringIO()) as test_output:
+            scheduler.print_empl_week(week, 'Some Employee')
+            assert test_output.getvalue().strip() == expected
+
+    def test_write_bundle(self):
+        """ Test write_bundle() writes every report, matching the CLI's. """
+
+        employees = scheduler.get_day_prefs('test_prefs')
+        week = {'monday': employees, 'tuesday': employees[1:]}
+
+        with tempfile.TemporaryDirectory() as outdir:
+            paths = scheduler.write_bundle(outdir, week)
+
+            expected = ['monday_by_time.txt', 'monday_by_empl.txt',
+                        'tuesday_by_time.txt', 'tuesday_by_empl.txt',
+                        'some_employee.txt', 'test_student.txt']
+            assert [os.path.basename(path) for path in paths] == expected
+            assert sorted(os.listdir(outdir)) == sorted(expected)
+
+            with patch('sys.stdout', new=StringIO()) as test_output:
+                scheduler.day_available_by_empl('test_prefs')
+
+            with open(os.path.join(outdir, 'monday_by_empl.txt')) as f:
+                assert f.read() == test_output.getvalue()
+
+    def test_write_bundle_unsafe_names(self):
+        """ Test write_bundle() with names that are unsafe or collide. """
+
+        employees = scheduler.DayPrefs(['A/B', 'a b', 'A  B'], [None] * 3,
+                                       ['XXXXXX'] * 3)
+
+        with tempfile.TemporaryDirectory() as outdir:
+            paths = scheduler.write_bundle(outdir, {'monday': employees})
+
+            expected = ['monday_by_time.txt', 'monday_by_empl.txt',
+                        'a_b.txt', 'a_b_2.txt', 'a_b_3.txt']
+            assert [os.path.basename(path) for path in paths] == expected
+            assert sorted(os.listdir(outdir)) == sorted(expected)
+
+            with open(os.path.join(outdir, 'a_b_3.txt')) as f:
+                assert f.readline() == 'A  B\n'